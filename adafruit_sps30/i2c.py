@@ -29,7 +29,17 @@ Implementation Notes
 """
 
 import time
-from struct import unpack_from
+from struct import pack_into, unpack_from
+
+try:
+    from struct import Struct
+except ImportError:
+    Struct = None  # not present in CircuitPython's struct module
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None  # optional library on CircuitPython, needed for *_async methods
 
 import adafruit_bus_device.i2c_device as i2c_device
 
@@ -43,7 +53,65 @@ __repo__ = "https://github.com/adafruit/Adafruit_CircuitPython_SPS30.git"
 SPS30_DEFAULT_ADDR = 0x69
 
 
-class SPS30_I2C(SPS30):
+# Lookup table for CRC-8 with polynomial 0x31 held as a bytes literal
+# so it does not need to be calculated at import, generated with:
+# for idx in range(256):
+#     crc = idx
+#     for _ in range(8):
+#         crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+#     print("\\x{:02x}".format(crc), end="\n" if idx % 16 == 15 else "")
+_CRC8_TABLE = (
+    b"\x00\x31\x62\x53\xc4\xf5\xa6\x97\xb9\x88\xdb\xea\x7d\x4c\x1f\x2e"
+    b"\x43\x72\x21\x10\x87\xb6\xe5\xd4\xfa\xcb\x98\xa9\x3e\x0f\x5c\x6d"
+    b"\x86\xb7\xe4\xd5\x42\x73\x20\x11\x3f\x0e\x5d\x6c\xfb\xca\x99\xa8"
+    b"\xc5\xf4\xa7\x96\x01\x30\x63\x52\x7c\x4d\x1e\x2f\xb8\x89\xda\xeb"
+    b"\x3d\x0c\x5f\x6e\xf9\xc8\x9b\xaa\x84\xb5\xe6\xd7\x40\x71\x22\x13"
+    b"\x7e\x4f\x1c\x2d\xba\x8b\xd8\xe9\xc7\xf6\xa5\x94\x03\x32\x61\x50"
+    b"\xbb\x8a\xd9\xe8\x7f\x4e\x1d\x2c\x02\x33\x60\x51\xc6\xf7\xa4\x95"
+    b"\xf8\xc9\x9a\xab\x3c\x0d\x5e\x6f\x41\x70\x23\x12\x85\xb4\xe7\xd6"
+    b"\x7a\x4b\x18\x29\xbe\x8f\xdc\xed\xc3\xf2\xa1\x90\x07\x36\x65\x54"
+    b"\x39\x08\x5b\x6a\xfd\xcc\x9f\xae\x80\xb1\xe2\xd3\x44\x75\x26\x17"
+    b"\xfc\xcd\x9e\xaf\x38\x09\x5a\x6b\x45\x74\x27\x16\x81\xb0\xe3\xd2"
+    b"\xbf\x8e\xdd\xec\x7b\x4a\x19\x28\x06\x37\x64\x55\xc2\xf3\xa0\x91"
+    b"\x47\x76\x25\x14\x83\xb2\xe1\xd0\xfe\xcf\x9c\xad\x3a\x0b\x58\x69"
+    b"\x04\x35\x66\x57\xc0\xf1\xa2\x93\xbd\x8c\xdf\xee\x79\x48\x1b\x2a"
+    b"\xc1\xf0\xa3\x92\x05\x34\x67\x56\x78\x49\x1a\x2b\xbc\x8d\xde\xef"
+    b"\x82\xb3\xe0\xd1\x46\x77\x24\x15\x3b\x0a\x59\x68\xff\xce\x9d\xac"
+)
+
+
+def _packet(command, arguments=()):
+    """Build the bytes to send for a command with a crc after each argument."""
+    packet = [(command >> 8) & 0xFF, command & 0xFF]
+    for arg in arguments:
+        arg_hi = (arg >> 8) & 0xFF
+        arg_lo = arg & 0xFF
+        packet += (arg_hi, arg_lo, _CRC8_TABLE[_CRC8_TABLE[0xFF ^ arg_hi] ^ arg_lo])
+    return bytes(packet)
+
+
+class _I2CBatch:
+    """Context manager holding the i2c bus lock across a sequence of commands."""
+
+    # pylint: disable=protected-access
+    def __init__(self, sps30):
+        self._sps30 = sps30
+        self._nested = False
+
+    def __enter__(self):
+        self._nested = self._sps30._i2c_locked is not None
+        if not self._nested:
+            self._sps30._i2c_locked = self._sps30.i2c_device.__enter__()
+        return self._sps30
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self._nested:
+            self._sps30._i2c_locked = None
+            self._sps30.i2c_device.__exit__(exc_type, exc_val, exc_tb)
+        return False
+
+
+class SPS30_I2C(SPS30):  # pylint: disable=too-many-instance-attributes
     """
     CircuitPython helper class for using the Sensirion SPS30 particulate matter sensor
     over the i2c interface.
@@ -79,7 +147,14 @@ class SPS30_I2C(SPS30):
 
     """
 
-    # pylint: disable=too-many-instance-attributes
+    # Start measurement for floating-point and integer output formats
+    _PKT_START_FP = _packet(SPS30._CMD_START_MEASUREMENT, (0x0300,))
+    _PKT_START_INT = _packet(SPS30._CMD_START_MEASUREMENT, (0x0500,))
+
+    # Formats for floating-point data once the crcs have been removed
+    _FP_WORDS_FMT = ">" + "HH" * len(SPS30.FIELD_NAMES)
+    _FP_VALUES_FMT = ">" + "f" * len(SPS30.FIELD_NAMES)
+
     def __init__(
         self,
         i2c_bus,
@@ -93,15 +168,43 @@ class SPS30_I2C(SPS30):
         super().__init__()
         self._buffer = bytearray(60)  # 10*(4+2)
         self.i2c_device = i2c_device.I2CDevice(i2c_bus, address)
-        self._cmd_buffer = bytearray(2 + 6)
+        self._i2c_locked = None
+        # Pre-built packets for the commands which are sent without arguments
+        self._cmd_packets = {
+            cmd: _packet(cmd)
+            for cmd in (
+                self._CMD_STOP_MEASUREMENT,
+                self._CMD_READ_DATA_READY_FLAG,
+                self._CMD_READ_MEASURED_VALUES,
+                self._CMD_SLEEP,
+                self._CMD_WAKEUP,
+                self._CMD_START_FAN_CLEANING,
+                self._CMD_RW_AUTO_CLEANING_INTERVAL,
+                self._CMD_READ_PRODUCT_TYPE,
+                self._CMD_READ_SERIAL_NUMBER,
+                self._CMD_READ_VERSION,
+                self._CMD_READ_DEVICE_STATUS_REG,
+                self._CMD_CLEAR_DEVICE_STATUS_REG,
+                self._CMD_SOFT_RESET,
+            )
+        }
+
+        # Field names paired with their offset in the raw integer data
+        self._int_field_offsets = tuple(
+            (key, idx * 3) for idx, key in enumerate(self.FIELD_NAMES)
+        )
 
         self._fp_mode = None
         self._mode_change_delay = mode_change_delay
         self._m_size = None
         self._m_total_size = None
         self._m_fmt = None
+        self._m_struct = None
+        self._parser = None
         self._delays = delays
-        self._starts = 0
+        # Command delays call this which does nothing if delays are disabled
+        self._sleep = time.sleep if delays else lambda _: None
+        self._started = False
         _ = self._set_fp_mode_fields(fp_mode)
 
         if auto_init:
@@ -124,15 +227,45 @@ class SPS30_I2C(SPS30):
 
         return ready
 
+    def batch(self):
+        """Return a context manager which holds the i2c bus lock so that a
+        sequence of commands does not lock and unlock the bus for each one.
+        The bus remains locked during any command delays so `start` and `clean`
+        which can wait for seconds should not be called inside a batch.
+        The ``_async`` methods raise a RuntimeError inside a batch as holding
+        the lock across an await would stall other tasks using the bus.
+
+        .. code-block:: python
+
+            with sps.batch():
+                sps.stop()
+                sps.clear_status_register()
+        """
+        return _I2CBatch(self)
+
+    def wait_for_data(self, timeout=2.0):
+        """Wait for data to become available polling with an increasing interval
+        between each check to reduce i2c traffic.
+        The SPS30 produces a new measurement every second
+        and this can be used before `read` to avoid reading stale data.
+        Returns True when data is available or False if none became
+        available within timeout seconds."""
+        start_t = time.monotonic()
+        delay = 0.002
+        while not self.data_available:
+            if time.monotonic() - start_t > timeout:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 1.5, 0.050)
+        return True
+
     @property
     def auto_cleaning_interval(self):
         """Read the auto cleaning interval."""
         self._sps30_command(self._CMD_RW_AUTO_CLEANING_INTERVAL, rx_size=6)
         self._buffer_check(6)
-        self._scrunch_buffer(6)
-        if self._delays:
-            time.sleep(0.005)
-        return unpack_from(">I", self._buffer)[0]
+        self._sleep(0.005)
+        return self._buffer_uint32()
 
     @auto_cleaning_interval.setter
     def auto_cleaning_interval(self, value):
@@ -148,8 +281,7 @@ class SPS30_I2C(SPS30):
             self._CMD_RW_AUTO_CLEANING_INTERVAL,
             arguments=((value >> 16) & 0xFFFF, value & 0xFFFF),
         )
-        if self._delays:
-            time.sleep(0.020)
+        self._sleep(0.020)
 
     def start(self, use_floating_point=None, *, stop_first=True):
         """Send start command to the SPS30.
@@ -163,16 +295,34 @@ class SPS30_I2C(SPS30):
         """
         if stop_first:
             self.stop()
+        time.sleep(self._start_command(use_floating_point))
+
+    async def start_async(self, use_floating_point=None, *, stop_first=True):
+        """Send start command to the SPS30 as per :meth:`start` but
+        yield to other tasks with asyncio.sleep during the delays."""
+        self._check_not_batched()
+        if stop_first:
+            await self.stop_async()
+        await asyncio.sleep(self._start_command(use_floating_point))
+
+    def _check_not_batched(self):
+        if self._i2c_locked is not None:
+            raise RuntimeError("The _async methods cannot be used inside batch()")
+
+    def _start_command(self, use_floating_point):
+        """Send start command returning the time to wait before using the SPS30."""
         request_fp = self._fp_mode if use_floating_point is None else use_floating_point
-        output_format = 0x0300 if request_fp else 0x0500
-        self._sps30_command(self._CMD_START_MEASUREMENT, arguments=(output_format,))
+        packet = self._PKT_START_FP if request_fp else self._PKT_START_INT
+        self._write_packet(packet)
         mode_changed = self._set_fp_mode_fields(request_fp)
+        delay = 0
         # Data sheet states command execution time < 20ms
         if self._delays:
-            time.sleep(0.020)
-            if (mode_changed or self._starts == 0) and self._mode_change_delay:
-                time.sleep(self._mode_change_delay)
-        self._starts += 1
+            delay = 0.020
+            if (mode_changed or not self._started) and self._mode_change_delay:
+                delay += self._mode_change_delay
+        self._started = True
+        return delay
 
     def clean(self, *, wait=True):
         """Start the fan cleaning and wait 15 seconds for it to complete.
@@ -180,46 +330,71 @@ class SPS30_I2C(SPS30):
         Firmware 2.2 sets bit 19 of status register during this operation -
         this is undocumented behaviour.
         """
-        self._sps30_command(self._CMD_START_FAN_CLEANING)
-        if wait:
-            delay = self.FAN_CLEAN_TIME if wait is True else wait
-            time.sleep(delay)
+        time.sleep(self._clean_command(wait))
+
+    async def clean_async(self, *, wait=True):
+        """Start the fan cleaning as per :meth:`clean` but
+        yield to other tasks with asyncio.sleep while waiting."""
+        self._check_not_batched()
+        await asyncio.sleep(self._clean_command(wait))
+
+    def _clean_command(self, wait):
+        """Send fan cleaning command returning the time to wait for it."""
+        self._write_packet(self._cmd_packets[self._CMD_START_FAN_CLEANING])
+        if not wait:
+            return 0
+        return self.FAN_CLEAN_TIME if wait is True else wait
 
     def stop(self):
         """Send stop command to SPS30."""
-        self._sps30_command(self._CMD_STOP_MEASUREMENT)
+        time.sleep(self._stop_command())
+
+    async def stop_async(self):
+        """Send stop command to SPS30 yielding to other tasks during the delay."""
+        self._check_not_batched()
+        await asyncio.sleep(self._stop_command())
+
+    def _stop_command(self):
+        """Send stop command returning the time to wait before the next command."""
+        self._write_packet(self._cmd_packets[self._CMD_STOP_MEASUREMENT])
         # Data sheet states command execution time < 20ms
-        if self._delays:
-            time.sleep(0.020)
+        return 0.020 if self._delays else 0
 
     def reset(self):
         """Perform a soft reset on the SPS30, restoring default values
         and placing sensor in Idle mode as if it had just powered up.
         The sensor must be started after a reset before data is read."""
-        self._sps30_command(self._CMD_SOFT_RESET)
+        time.sleep(self._reset_command())
+
+    async def reset_async(self):
+        """Perform a soft reset as per :meth:`reset` but
+        yield to other tasks with asyncio.sleep during the delay."""
+        self._check_not_batched()
+        await asyncio.sleep(self._reset_command())
+
+    def _reset_command(self):
+        """Send soft reset command returning the time to wait after it."""
+        self._write_packet(self._cmd_packets[self._CMD_SOFT_RESET])
         # Data sheet states command execution time < 100ms
-        if self._delays:
-            time.sleep(0.100)
+        return 0.100 if self._delays else 0
 
     def sleep(self):
         """Enters the Sleep-Mode with minimum power consumption."""
-        self._sps30_command(self._CMD_SLEEP)
+        self._write_packet(self._cmd_packets[self._CMD_SLEEP])
         # Data sheet states command execution time < 5ms
-        if self._delays:
-            time.sleep(0.005)
+        self._sleep(0.005)
 
     def wakeup(self):
         """Switch from Sleep-Mode to Idle-Mode."""
         # Data sheet has two methods to wake-up, one way is to
         # intentionally send two consecutive wake-up commands
         try:
-            self._sps30_command(self._CMD_WAKEUP)
+            self._write_packet(self._cmd_packets[self._CMD_WAKEUP])
         except OSError:
             pass  # ignore any Errno 19 for first command
-        self._sps30_command(self._CMD_WAKEUP)
+        self._write_packet(self._cmd_packets[self._CMD_WAKEUP])
         # Data sheet states command execution time < 5ms
-        if self._delays:
-            time.sleep(0.005)
+        self._sleep(0.005)
 
     def read_firmware_version(self):
         """Read firmware version returning as two element tuple."""
@@ -235,15 +410,13 @@ class SPS30_I2C(SPS30):
         # https://github.com/Sensirion/arduino-sps/blob/master/sps30.cpp
         self._sps30_command(self._CMD_READ_DEVICE_STATUS_REG, rx_size=6)
         self._buffer_check(6)
-        self._scrunch_buffer(6)
-        return unpack_from(">I", self._buffer)[0]
+        return self._buffer_uint32()
 
     def clear_status_register(self):
         """Clear 32bit status register."""
-        self._sps30_command(self._CMD_CLEAR_DEVICE_STATUS_REG)
+        self._write_packet(self._cmd_packets[self._CMD_CLEAR_DEVICE_STATUS_REG])
         # Data sheet states command execution time < 5ms
-        if self._delays:
-            time.sleep(0.005)
+        self._sleep(0.005)
 
     def _set_fp_mode_fields(self, use_floating_point):
         if self._fp_mode == use_floating_point:
@@ -252,7 +425,20 @@ class SPS30_I2C(SPS30):
         self._m_size = 6 if self._fp_mode else 3
         self._m_total_size = len(self.FIELD_NAMES) * self._m_size
         self._m_parse_size = len(self.FIELD_NAMES) * (self._m_size * 2 // 3)
-        self._m_fmt = ">" + ("f" if self._fp_mode else "H") * len(self.FIELD_NAMES)
+        if self._fp_mode:
+            # The 16bit words of data can be unpacked directly from the raw
+            # buffer skipping the crcs
+            self._m_fmt = ">" + "Hx" * (self._m_parse_size // 2)
+            # Pre-compiled format saves parsing the string on every read on CPython
+            self._m_struct = Struct(self._m_fmt) if Struct else None
+            parser = self._read_parse_fp_data
+        else:
+            # Integer data is parsed directly from the buffer by table lookups
+            self._m_fmt = None
+            self._m_struct = None
+            parser = self._read_parse_int_data
+        # Select the parser for the mode once here rather than on every read
+        self._parser = parser
         return True
 
     def _sps30_command(
@@ -265,76 +451,98 @@ class SPS30_I2C(SPS30):
         delay=0
     ):
         """Set rx_size to None to read arbitrary amount of data up to max of _buffer size"""
-        self._cmd_buffer[0] = (command >> 8) & 0xFF
-        self._cmd_buffer[1] = command & 0xFF
-        tx_size = 2
-
-        # Add arguments if any
-        if arguments is not None:
-            for arg in arguments:
-                self._cmd_buffer[tx_size] = (arg >> 8) & 0xFF
-                tx_size += 1
-                self._cmd_buffer[tx_size] = arg & 0xFF
-                tx_size += 1
-                self._cmd_buffer[tx_size] = self._crc8(
-                    self._cmd_buffer, start=tx_size - 2, end=tx_size
-                )
-                tx_size += 1
+        packets = self._cmd_packets
+        if arguments is None and command in packets:
+            tx_data = packets[command]
+        else:
+            tx_data = _packet(command, () if arguments is None else arguments)
+
+        i2c = self._i2c_locked
+        if i2c is not None:
+            self._transfer(i2c, tx_data, rx_size, delay)
+        else:
+            with self.i2c_device as i2c:
+                self._transfer(i2c, tx_data, rx_size, delay)
 
+        if retry:
+            pass  # implement retries with appropriate exception handling
+
+    def _transfer(self, i2c, tx_data, rx_size, delay):
         # The write_then_readinto method cannot be used as the SPS30
         # does not like it based on real tests using self._CMD_READ_VERSION
         # This is probably due to lack of support for i2c repeated start
-        with self.i2c_device as i2c:
-            i2c.write(self._cmd_buffer, end=tx_size)
-            if delay:
-                time.sleep(delay)
-            if rx_size != 0:
-                i2c.readinto(self._buffer, end=rx_size)
-
-        if retry:
-            pass  # implement retries with appropriate exception handling
+        i2c.write(tx_data)
+        if delay:
+            time.sleep(delay)
+        if rx_size != 0:
+            i2c.readinto(self._buffer, end=rx_size)
+
+    def _write_packet(self, packet):
+        """Send a pre-built packet for a command which has no response."""
+        i2c = self._i2c_locked
+        if i2c is not None:
+            i2c.write(packet)
+        else:
+            with self.i2c_device as i2c:
+                i2c.write(packet)
 
     def _read_into_buffer(self):
-        data_len = self._m_total_size
-        self._sps30_command(self._CMD_READ_MEASURED_VALUES, rx_size=data_len)
-        self._buffer_check(data_len)
-
-    def _scrunch_buffer(self, raw_data_len):
-        """Move all the data from 0:raw_data_len to one contiguous sequence at
-        the start of the buffer.
-        This will overwrite some of the interleaved crcs."""
-        dst_idx = 2
-        for src_idx in range(3, raw_data_len, 3):
-            self._buffer[dst_idx : dst_idx + 2] = self._buffer[src_idx : src_idx + 2]
-            dst_idx += 2
+        # data is checked by the parser for the mode in _read_parse_data
+        self._sps30_command(self._CMD_READ_MEASURED_VALUES, rx_size=self._m_total_size)
 
-    def _read_parse_data(self, output):
-        self._scrunch_buffer(self._m_total_size)
+    def _buffer_uint32(self):
+        """Return the 32bit value held in two crc-checked chunks at the start
+        of the buffer without needing to scrunch it."""
+        buf = self._buffer
+        return (buf[0] << 24) | (buf[1] << 16) | (buf[3] << 8) | buf[4]
 
-        # buffer will be longer than the data hence the use of unpack_from
-        for key, val in zip(self.FIELD_NAMES, unpack_from(self._m_fmt, self._buffer)):
-            output[key] = val
+    def _read_parse_data(self, output):
+        self._parser(output)
+
+    def _read_parse_int_data(self, output):
+        # single pass over the raw buffer checking crcs and collecting values,
+        # output is only updated once every crc has been checked
+        table = _CRC8_TABLE
+        buf = self._buffer
+        values = []
+        for key, st_chunk in self._int_field_offsets:
+            val_hi = buf[st_chunk]
+            val_lo = buf[st_chunk + 1]
+            if buf[st_chunk + 2] != table[table[0xFF ^ val_hi] ^ val_lo]:
+                raise RuntimeError("CRC mismatch in data at offset " + str(st_chunk))
+            values.append((key, (val_hi << 8) | val_lo))
+        output.update(values)
+
+    def _read_parse_fp_data(self, output):
+        self._buffer_check(self._m_total_size)
+
+        # Each float straddles a crc so the words are unpacked and then
+        # packed contiguously at the start of the buffer to read as floats
+        buf = self._buffer
+        m_struct = self._m_struct
+        if m_struct:
+            words = m_struct.unpack_from(buf)
+        else:
+            words = unpack_from(self._m_fmt, buf)
+        pack_into(self._FP_WORDS_FMT, buf, 0, *words)
+        output.update(zip(self.FIELD_NAMES, unpack_from(self._FP_VALUES_FMT, buf)))
 
     def _buffer_check(self, raw_data_len):
         if raw_data_len % 3 != 0:
             raise RuntimeError("Data length not a multiple of three")
 
+        # CRC for each two byte chunk is inlined as two table lookups
+        table = _CRC8_TABLE
+        buf = self._buffer
+        # Single chunk responses (data ready flag, firmware version) skip the loop
+        if raw_data_len == 3:
+            if buf[2] != table[table[0xFF ^ buf[0]] ^ buf[1]]:
+                raise RuntimeError("CRC mismatch in data at offset 0")
+            return
+
         for st_chunk in range(0, raw_data_len, 3):
-            if self._buffer[st_chunk + 2] != self._crc8(
-                self._buffer, st_chunk, st_chunk + 2
+            if (
+                buf[st_chunk + 2]
+                != table[table[0xFF ^ buf[st_chunk]] ^ buf[st_chunk + 1]]
             ):
                 raise RuntimeError("CRC mismatch in data at offset " + str(st_chunk))
-
-    @staticmethod
-    def _crc8(buffer, start=None, end=None):
-        crc = 0xFF
-        for idx in range(
-            0 if start is None else start, len(buffer) if end is None else end
-        ):
-            crc ^= buffer[idx]
-            for _ in range(8):
-                if crc & 0x80:
-                    crc = (crc << 1) ^ 0x31
-                else:
-                    crc = crc << 1
-        return crc & 0xFF  # return the bottom 8 bits
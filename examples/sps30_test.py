@@ -20,7 +20,10 @@ from adafruit_sps30.i2c import SPS30_I2C
 DELAYS = (5.0, 2.0, 1.0, 0.1, 0.0, 0.0)
 DEF_READS = len(DELAYS)
 PM_PREFIXES = ("pm10", "pm25", "pm40", "pm100")
-TEST_VERSION = "1.2"
+PM_KEYS = tuple(pm + " standard" for pm in PM_PREFIXES)
+ROW_FORMAT = "{}\t{}\t{}\t{}".format
+FIELD_FORMAT = "{:s}: {}".format
+TEST_VERSION = "1.3"
 
 
 def some_reads(sps, num=DEF_READS):
@@ -35,14 +38,14 @@ def some_reads(sps, num=DEF_READS):
             print("PM1\tPM2.5\tPM4\tPM10")
             output_header = False
         # print(data)
-        print("{}\t{}\t{}\t{}".format(*[data[pm + " standard"] for pm in PM_PREFIXES]))
+        print(ROW_FORMAT(*[data[key] for key in PM_KEYS]))
         if idx != last_idx:
             time.sleep(DELAYS[idx])
 
     # Just for last value
     print("ALL for last read")
     for field in sps.FIELD_NAMES:
-        print("{:s}: {}".format(field, data[field]))
+        print(FIELD_FORMAT(field, data[field]))
 
 
 print()
@@ -96,11 +99,9 @@ sps30_fp.stop()
 print("Start and wait for data to become available")
 sps30_fp.start()
 start_t = time.monotonic()
-while True:
-    now_t = time.monotonic()
-    got_data = sps30_fp.data_available
-    if got_data or now_t - start_t > 30.0:
-        break
+# polls with an increasing interval rather than flooding the i2c bus
+got_data = sps30_fp.wait_for_data(timeout=30.0)
+now_t = time.monotonic()
 print("Time since start: ", now_t - start_t)
 print("Data available:", got_data)
 print("Six more reads")